@@ -32,59 +32,76 @@ st.set_page_config(page_title="RAG Chat Assistant", layout="wide")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# The same conversation in Gemini's format, kept in step with messages
+if "gemini_messages" not in st.session_state:
+    st.session_state.gemini_messages = []
+
 if "rag_system" not in st.session_state:
     st.session_state.rag_system = None
 
-if "processed_pdfs" not in st.session_state:
-    st.session_state.processed_pdfs = set()  # Changed to set for unique entries
+# Number of previous messages (10 user/assistant turns) sent as chat history
+CHAT_HISTORY_WINDOW = 20
 
-PROCESSED_PDFS_FILE = os.path.join(UPLOAD_DIR, "processed_pdfs.txt")
+IMAGE_MARKDOWN_RE = re.compile(r"!\[([^\]]*)\]\(([^)]+)\)")
 
 
-def load_processed_pdfs():
-    """Loads previously processed PDFs from a file and verifies their existence."""
-    if os.path.exists(PROCESSED_PDFS_FILE):
-        with open(PROCESSED_PDFS_FILE, "r") as f:
-            pdfs = [line.strip() for line in f.readlines()]
-            # Only keep PDFs that still exist in the filesystem
-            st.session_state.processed_pdfs = {
-                pdf for pdf in pdfs if os.path.exists(os.path.join(UPLOAD_DIR, os.path.basename(pdf)))
-            }
-    else:
-        st.session_state.processed_pdfs = set()
+def add_message(role, content):
+    """Appends a message to both the display and the Gemini chat histories."""
+    st.session_state.messages.append({"role": role, "content": content})
+    st.session_state.gemini_messages.append({
+        "role": "user" if role == "user" else "model",
+        "parts": [content]
+    })
+
 
-    # Scan upload directory for any PDFs not in the list
-    for file in os.listdir(UPLOAD_DIR):
-        if file.endswith('.pdf'):
-            full_path = os.path.join(UPLOAD_DIR, file)
-            st.session_state.processed_pdfs.add(full_path)
+@st.cache_data(ttl=5)
+def _scan_upload_dir():
+    """Lists the PDFs in the upload directory, cached across reruns."""
+    return {
+        os.path.join(UPLOAD_DIR, file)
+        for file in os.listdir(UPLOAD_DIR) if file.endswith('.pdf')
+    }
 
 
-def save_processed_pdfs():
-    """Saves processed PDFs to a file."""
-    with open(PROCESSED_PDFS_FILE, "w") as f:
-        for pdf_path in st.session_state.processed_pdfs:
-            f.write(f"{pdf_path}\n")
+@st.cache_data(ttl=10)
+def _ingested_pdf_names(_rag_system, pdf_names):
+    """Returns which of the given PDF names have chunks in ChromaDB, cached across reruns."""
+    return {name for name in pdf_names if _rag_system.is_pdf_ingested(name)}
 
 
-def initialize_rag_system(api_key):
+def get_ingested_pdfs(pdfs):
+    """Returns the names of the given PDFs that have been ingested into ChromaDB."""
+    pdf_names = tuple(sorted(os.path.basename(pdf) for pdf in pdfs))
     if st.session_state.rag_system is None:
-        st.session_state.rag_system = MultimodalRag(
-            api_key=api_key,
-            collection_name="streamlit_rag"
-        )
+        return set(pdf_names)
+    return _ingested_pdf_names(st.session_state.rag_system, pdf_names)
+
 
-        # Process any unprocessed PDFs
-        load_processed_pdfs()  # Ensure list is up to date
-        for pdf_path in st.session_state.processed_pdfs:
+@st.cache_resource
+def get_rag(api_key, collection_name="streamlit_rag"):
+    """Creates one MultimodalRag per API key, shared across reruns."""
+    return MultimodalRag(
+        api_key=api_key,
+        collection_name=collection_name
+    )
+
+
+def initialize_rag_system(api_key, strategy="auto"):
+    rag_system = get_rag(api_key)
+    if st.session_state.rag_system is not rag_system:
+        st.session_state.rag_system = rag_system
+
+        # Process any uploaded PDFs that are not in ChromaDB yet
+        for pdf_path in _scan_upload_dir():
             if os.path.exists(pdf_path):  # Verify file still exists
                 try:
-                    st.session_state.rag_system.ingest_pdf(pdf_path)
+                    # ingest_pdf skips PDFs that are already in ChromaDB
+                    st.session_state.rag_system.ingest_pdf(
+                        pdf_path, strategy=strategy)
                 except Exception as e:
                     st.error(
                         f"Error processing PDF {os.path.basename(pdf_path)}: {str(e)}")
-                    st.session_state.processed_pdfs.remove(pdf_path)
-        save_processed_pdfs()
+        _ingested_pdf_names.clear()
 
 
 # Title
@@ -96,8 +113,17 @@ with st.sidebar:
 
     # API Key input
     api_key = st.text_input("Enter Gemini API Key", type="password")
+
+    # PDF parsing strategy
+    strategy = st.selectbox(
+        "PDF Parsing Strategy",
+        options=["auto", "hi_res", "fast"],
+        help="auto uses the fast text parser for digital PDFs without figures, "
+             "and hi_res (layout model + OCR) otherwise"
+    )
+
     if api_key:
-        initialize_rag_system(api_key)
+        initialize_rag_system(api_key, strategy)
 
     # Path configurations
     with st.expander("Path Configuration", expanded=True):
@@ -122,35 +148,44 @@ with st.sidebar:
                 os.add_dll_directory(poppler_path)
                 os.add_dll_directory(tesseract_path)
 
-    # Display currently processed PDFs
+    # Display uploaded PDFs, flagging any that never made it into ChromaDB
     st.subheader("Processed PDFs")
-    load_processed_pdfs()  # Load the current list of PDFs
+    uploaded_pdfs = _scan_upload_dir()
+    ingested_pdfs = get_ingested_pdfs(uploaded_pdfs)
 
-    if not st.session_state.processed_pdfs:
+    if not uploaded_pdfs:
         st.info("No PDFs have been processed yet.")
     else:
-        for pdf_path in sorted(st.session_state.processed_pdfs):
+        for pdf_path in sorted(uploaded_pdfs):
             col1, col2 = st.columns([4, 2])
             with col1:
                 st.text(os.path.basename(pdf_path))
+                if os.path.basename(pdf_path) not in ingested_pdfs:
+                    st.caption("Not ingested (failed or no content)")
             with col2:
                 if st.button(f"Remove", key=f"remove_{pdf_path}"):
                     try:
                         if os.path.exists(pdf_path):
                             os.remove(pdf_path)
-                        st.session_state.processed_pdfs.remove(pdf_path)
-                        save_processed_pdfs()
+                        _scan_upload_dir.clear()
 
                         # Remove from ChromaDB
                         if st.session_state.rag_system:
                             st.session_state.rag_system.remove_pdf_from_chromadb(
                                 os.path.basename(pdf_path))
+                            _ingested_pdf_names.clear()
 
-                        st.session_state.rag_system = None  # Reset RAG system
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error deleting PDF: {str(e)}")
 
+    # Restrict retrieval to a single PDF
+    ALL_PDFS = "All PDFs"
+    selected_pdf = st.selectbox(
+        "Search In",
+        options=[ALL_PDFS] + sorted(ingested_pdfs)
+    )
+
     # File upload
     uploaded_file = st.file_uploader("Upload PDF", type="pdf")
 
@@ -164,42 +199,37 @@ with st.sidebar:
                     # Save the file
                     with open(pdf_path, "wb") as f:
                         f.write(uploaded_file.getvalue())
+                    _scan_upload_dir.clear()
 
                     # Initialize RAG system if needed
                     if st.session_state.rag_system is None:
-                        st.session_state.rag_system = MultimodalRag(
-                            api_key=api_key,
-                            collection_name="streamlit_rag"
-                        )
+                        st.session_state.rag_system = get_rag(api_key)
 
                     # Process the PDF
-                    st.session_state.rag_system.ingest_pdf(pdf_path)
-
-                    # Add to processed PDFs set if not already there
-                    st.session_state.processed_pdfs.add(pdf_path)
-                    save_processed_pdfs()
+                    st.session_state.rag_system.ingest_pdf(
+                        pdf_path, strategy=strategy)
+                    _ingested_pdf_names.clear()
 
                     st.success("PDF processed successfully!")
 
                     # Add system message to chat
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": f"I've processed the PDF '{uploaded_file.name}'. You can now ask me questions about it."
-                    })
+                    add_message(
+                        "assistant",
+                        f"I've processed the PDF '{uploaded_file.name}'. You can now ask me questions about it."
+                    )
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error processing PDF: {str(e)}")
 
 
 def st_markdown(markdown_string):
-    parts = re.split(r"!\[(.*?)\]\((.*?)\)", markdown_string)
-    for i, part in enumerate(parts):
-        if i % 3 == 0:
-            st.markdown(part)
-        elif i % 3 == 1:
-            title = part
-        else:
-            st.image(part)  # Add caption if you want -> , caption=title)
+    """Renders markdown, showing ![title](path) references as images."""
+    position = 0
+    for match in IMAGE_MARKDOWN_RE.finditer(markdown_string):
+        st.markdown(markdown_string[position:match.start()])
+        st.image(match.group(2))  # Add caption if you want -> , caption=match.group(1))
+        position = match.end()
+    st.markdown(markdown_string[position:])
 
 
 # Display chat messages
@@ -213,33 +243,33 @@ if st.session_state.rag_system is not None:
     user_input = st.chat_input("Type your question...")
     if user_input:
         # Add user message and display it
-        st.session_state.messages.append(
-            {"role": "user", "content": user_input}
-        )
+        add_message("user", user_input)
         with st.chat_message("user"):
             st_markdown(user_input)
 
         # Get and display assistant response
         try:
             with st.spinner("Thinking..."):
-                # Convert session messages to Gemini format
-                gemini_messages = []
-                for msg in st.session_state.messages[:-1]:  # Exclude the latest user message
-                    gemini_messages.append({
-                        "role": "user" if msg["role"] == "user" else "model",
-                        "parts": [msg["content"]]
-                    })
-                
-                response = st.session_state.rag_system.invoke(
+                # Recent history only, excluding the latest user message
+                chat_history = st.session_state.gemini_messages[
+                    -(CHAT_HISTORY_WINDOW + 1):-1]
+
+                response_stream = st.session_state.rag_system.invoke(
                     user_input,
-                    chat_history=gemini_messages
-                )
-                
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": response}
+                    chat_history=chat_history,
+                    pdf_name=None if selected_pdf == ALL_PDFS else selected_pdf,
+                    stream=True
                 )
-                with st.chat_message("assistant"):
-                    st_markdown(response)
+
+            with st.chat_message("assistant"):
+                # Stream plain text first, then re-render with images once complete
+                placeholder = st.empty()
+                with placeholder.container():
+                    response = st.write_stream(response_stream)
+                placeholder.empty()
+                st_markdown(response)
+
+            add_message("assistant", response)
         except Exception as e:
             st.error(f"Error generating response: {str(e)}")
 else:
@@ -249,4 +279,5 @@ else:
 with st.sidebar:
     if st.button("Clear Chat"):
         st.session_state.messages = []
+        st.session_state.gemini_messages = []
         st.rerun()
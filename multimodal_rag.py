@@ -1,11 +1,22 @@
 import os
 import shutil
+import asyncio
+import hashlib
+import tempfile
+import time
+import mimetypes
+from functools import lru_cache
 from tqdm import tqdm
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import json
 
 import nltk
+from PIL import Image
 from unstructured.partition.pdf import partition_pdf
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
 
 import google.generativeai as genai
 import chromadb
@@ -13,6 +24,126 @@ from chromadb.config import Settings
 
 from prompts import RAG_SYSTEM_PROMPT, IMAGE_SYSTEM_PROMPT
 
+EMBEDDING_MODEL = "models/text-embedding-004"
+GENERATION_MODEL = "gemini-2.0-flash-exp"
+IMAGE_SUMMARY_PROMPT = "Analyze the provided image and generate a concise, detailed summary."
+EMBEDDING_BATCH_SIZE = 100
+IMAGE_SUMMARY_CONCURRENCY = 8
+# Gemini rejects inline request payloads over 20MB, larger images go through the File API
+INLINE_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+# Long edge that figures are downscaled to before summarization
+IMAGE_MAX_SIZE = 1024
+CHROMA_ADD_BATCH_SIZE = 250
+# Chunk sizes are measured in whitespace-separated words as a cheap proxy
+# for embedding model tokens
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 30
+PARTITION_STRATEGIES = ("auto", "hi_res", "fast")
+BORN_DIGITAL_MIN_CHARS = 100
+BORN_DIGITAL_PROBE_PAGES = 3
+QUERY_EMBEDDING_CACHE_SIZE = 512
+IMAGE_SUMMARY_ERROR_MESSAGE = "Error: Unable to summarize image"
+RESPONSE_ERROR_MESSAGE = "I encountered an error while processing your question. Please try again or rephrase your question."
+
+
+@lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+def _cached_query_embedding(text: str) -> tuple:
+    """Embed a search query, memoized so repeated questions skip the API"""
+    result = genai.embed_content(
+        model=EMBEDDING_MODEL,
+        content=text,
+        task_type="retrieval_query"
+    )
+    return tuple(result['embedding'])
+
+
+def _has_image_xobject(resources, seen) -> bool:
+    """Check page resources for image XObjects, descending into form XObjects"""
+    xobjects = resolve1((resolve1(resources) or {}).get("XObject")) or {}
+    for xobject in xobjects.values():
+        if id(xobject) in seen:
+            continue
+        seen.add(id(xobject))
+        xobject = resolve1(xobject)
+        subtype = getattr(xobject.get("Subtype"), "name", None)
+        if subtype == "Image":
+            return True
+        if subtype == "Form" and _has_image_xobject(xobject.get("Resources"), seen):
+            return True
+    return False
+
+
+def _pdf_has_images(pdf_path: str) -> bool:
+    """Check every page for embedded images without running layout analysis"""
+    with open(pdf_path, "rb") as f:
+        for page in PDFPage.get_pages(f):
+            if _has_image_xobject(page.resources, set()):
+                return True
+    return False
+
+
+def _split_into_units(page) -> List[str]:
+    """Split a page into sentences, keeping each image reference whole"""
+    units = []
+    for data in page:
+        if data['type'] == "Image":
+            image_path = data['metadata']['image_path']
+            relative_image_path = image_path.replace(os.getcwd(), ".")
+            units.append(f"![{data['image_summary']}]({relative_image_path})")
+            continue
+        for sentence in nltk.sent_tokenize(data['text']):
+            words = sentence.split()
+            # Break up run-on "sentences" such as long tables, leaving room
+            # for the overlap carried in from the previous window
+            piece_size = CHUNK_SIZE - CHUNK_OVERLAP
+            for start in range(0, len(words), piece_size):
+                units.append(" ".join(words[start:start + piece_size]))
+    return units
+
+
+def _overlap_tail(window: List[str], max_words: int) -> Tuple[List[str], int]:
+    """Return up to max_words trailing words of a window to start the next one"""
+    tail = []
+    tail_size = 0
+    for unit in reversed(window):
+        words = unit.split()
+        if tail_size + len(words) <= max_words:
+            tail.insert(0, unit)
+            tail_size += len(words)
+            continue
+        # Cut into a long sentence rather than lose the overlap, but never
+        # split an image reference
+        remaining = max_words - tail_size
+        if remaining > 0 and not unit.startswith("!["):
+            tail.insert(0, " ".join(words[-remaining:]))
+            tail_size += remaining
+        break
+    return tail, tail_size
+
+
+def _chunk_page(page) -> List[Dict[str, Any]]:
+    """Pack a page's sentences into overlapping windows of at most CHUNK_SIZE words.
+
+    Only an image reference longer than CHUNK_SIZE, which is never split,
+    can produce a larger chunk.
+    """
+    page_number = page[0]['metadata']['page_number']
+    chunks = []
+    window = []
+    window_size = 0
+    for unit in _split_into_units(page):
+        unit_size = len(unit.split())
+        if window and window_size + unit_size > CHUNK_SIZE:
+            chunks.append({"text": " ".join(window), "page_number": page_number})
+            # Shrink the overlap if needed so the next window still fits
+            window, window_size = _overlap_tail(
+                window, min(CHUNK_OVERLAP, max(CHUNK_SIZE - unit_size, 0)))
+        window.append(unit)
+        window_size += unit_size
+    if window:
+        chunks.append({"text": " ".join(window), "page_number": page_number})
+    return chunks
+
 
 class MultimodalRag:
     def __init__(self, api_key: str, collection_name: str, db_path: str = "./chroma_db"):
@@ -28,6 +159,10 @@ class MultimodalRag:
                 allow_reset=True
             )
         )
+        self._tune_sqlite()
+        self._collection = self.client.get_or_create_collection(
+            name=self.collection_name
+        )
 
         # Configure Gemini
         genai.configure(api_key=self.api_key)
@@ -40,13 +175,13 @@ class MultimodalRag:
         }
 
         self.rag_model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
+            model_name=GENERATION_MODEL,
             generation_config=self.generation_config,
             system_instruction=RAG_SYSTEM_PROMPT
         )
 
         self.image_model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
+            model_name=GENERATION_MODEL,
             generation_config=self.generation_config,
             system_instruction=IMAGE_SYSTEM_PROMPT
         )
@@ -55,11 +190,43 @@ class MultimodalRag:
         self.metadata_dir = os.path.join(db_path, "metadata")
         os.makedirs(self.metadata_dir, exist_ok=True)
 
-    def _save_pdf_metadata(self, pdf_path: str, chunks: List[str]) -> None:
+        # Create image summary cache directory, keyed by image content hash.
+        # The subdirectory changes with the model and prompts, so editing
+        # either doesn't serve stale summaries.
+        summary_version = hashlib.sha256("\n".join(
+            [GENERATION_MODEL, IMAGE_SYSTEM_PROMPT, IMAGE_SUMMARY_PROMPT]
+        ).encode("utf-8")).hexdigest()[:16]
+        self._summary_cache_dir = os.path.join(
+            db_path, "image_summaries", summary_version)
+        os.makedirs(self._summary_cache_dir, exist_ok=True)
+
+    def _tune_sqlite(self) -> None:
+        """Switch ChromaDB's SQLite database to WAL journaling.
+
+        journal_mode=WAL is stored in the database file, so it applies to every
+        connection Chroma opens later, from any thread. Per-connection pragmas
+        such as synchronous or temp_store would only reach the connection used
+        here, so they are not set. Chroma 1.x has no Python SQLite connection
+        to tune, in which case this is a no-op.
+        """
+        server = getattr(self.client, "_server", self.client)
+        sysdb = getattr(server, "_sysdb", None)
+        conn_pool = getattr(sysdb, "_conn_pool", None)
+        if conn_pool is None:
+            print("ChromaDB backend exposes no SQLite connection, skipping WAL setup")
+            return
+        try:
+            conn = conn_pool.connect()
+            conn.execute("PRAGMA journal_mode=WAL")
+        except Exception as e:
+            print(f"Error enabling WAL for ChromaDB SQLite: {str(e)}")
+
+    def _save_pdf_metadata(self, pdf_path: str, chunks: List[Dict[str, Any]]) -> None:
         """Save metadata about processed PDF for future reference"""
         metadata = {
             "pdf_name": os.path.basename(pdf_path),
             "full_path": pdf_path,
+            "pdf_hash": self._hash_pdf(pdf_path),
             "chunk_count": len(chunks),
             "processing_status": "completed"
         }
@@ -78,10 +245,27 @@ class MultimodalRag:
                 return json.load(f)
         return None
 
+    def _hash_pdf(self, pdf_path: str) -> str:
+        """Compute the sha256 of the PDF contents"""
+        sha256 = hashlib.sha256()
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def is_pdf_ingested(self, pdf_name: str) -> bool:
+        """Check whether ChromaDB holds any chunks for a PDF"""
+        existing = self._collection.get(
+            where={"pdf_name": pdf_name}, limit=1, include=[])
+        return len(existing["ids"]) > 0
+
     def delete_collection(self) -> None:
         """Safely delete the collection and its metadata"""
         try:
             self.client.delete_collection(self.collection_name)
+            self._collection = self.client.get_or_create_collection(
+                name=self.collection_name
+            )
             # Also clean up metadata directory
             if os.path.exists(self.metadata_dir):
                 shutil.rmtree(self.metadata_dir)
@@ -97,28 +281,96 @@ class MultimodalRag:
             print(f"Error uploading file to Gemini: {str(e)}")
             raise
 
-    def summarise_image(self, image_path: str) -> str:
-        """Generate summary for an image with retry logic"""
-        max_retries = 3
-        for attempt in range(max_retries):
+    def summarise_image(self, image_path: str, image_hash: str = None) -> str:
+        """Generate summary for an image, reusing cached summaries of identical images"""
+        if image_hash is None:
+            with open(image_path, "rb") as f:
+                image_hash = hashlib.sha256(f.read()).hexdigest()
+        cache_path = os.path.join(self._summary_cache_dir, f"{image_hash}.txt")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read()
+
+        summary = self._generate_image_summary(image_path)
+        if summary != IMAGE_SUMMARY_ERROR_MESSAGE:
+            # Write to a temp file and rename it into place, so a crash or a
+            # concurrent writer never leaves a truncated summary in the cache
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self._summary_cache_dir, suffix=".tmp")
             try:
-                file = self.upload_to_gemini(
-                    image_path, mime_type="image/jpeg")
-                chat_session = self.image_model.start_chat(
-                    history=[{"role": "user", "parts": [file]}]
-                )
-                response = chat_session.send_message(
-                    "Analyze the provided image and generate a concise, detailed summary."
-                )
-                return response.text
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(summary)
+                os.replace(tmp_path, cache_path)
             except Exception as e:
-                if attempt == max_retries - 1:
-                    print(
-                        f"Failed to summarize image after {max_retries} attempts: {str(e)}")
-                    return "Error: Unable to summarize image"
-                continue
+                print(f"Error caching image summary: {str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return summary
 
-    def process_pdf(self, pdf_path: str) -> List[str]:
+    def _generate_image_summary(self, image_path: str) -> str:
+        """Generate summary for an image with retry logic"""
+        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+
+        uploaded_file = None
+        try:
+            if os.path.getsize(image_path) > INLINE_IMAGE_MAX_BYTES:
+                uploaded_file = self.upload_to_gemini(
+                    image_path, mime_type=mime_type)
+                image_part = uploaded_file
+            else:
+                with open(image_path, "rb") as f:
+                    image_part = {"mime_type": mime_type, "data": f.read()}
+        except Exception as e:
+            print(f"Error reading image {image_path}: {str(e)}")
+            return IMAGE_SUMMARY_ERROR_MESSAGE
+
+        try:
+            max_retries = 3
+            for attempt in range(max_retries):
+                try:
+                    response = self.image_model.generate_content([
+                        image_part,
+                        IMAGE_SUMMARY_PROMPT
+                    ])
+                    return response.text
+                except Exception as e:
+                    if attempt == max_retries - 1:
+                        print(
+                            f"Failed to summarize image after {max_retries} attempts: {str(e)}")
+                        return IMAGE_SUMMARY_ERROR_MESSAGE
+                    time.sleep(2 ** attempt)
+        finally:
+            # Don't leave one-shot uploads in File API storage
+            if uploaded_file is not None:
+                try:
+                    genai.delete_file(uploaded_file.name)
+                except Exception as e:
+                    print(f"Error deleting file from Gemini: {str(e)}")
+
+    def _choose_strategy(self, pdf_path: str, strategy: str) -> str:
+        """Use the cheap "fast" parser for born-digital PDFs without figures"""
+        if strategy not in PARTITION_STRATEGIES:
+            raise ValueError(
+                f"strategy must be one of {PARTITION_STRATEGIES}, got {strategy!r}")
+        if strategy != "auto":
+            return strategy
+        try:
+            # Figures need hi_res for image extraction, and scanned pages are
+            # full-page images, so any image means hi_res
+            if _pdf_has_images(pdf_path):
+                return "hi_res"
+            # Layout analysis is expensive, only probe the first few pages
+            text_chars = 0
+            for page in extract_pages(pdf_path, maxpages=BORN_DIGITAL_PROBE_PAGES):
+                for element in page:
+                    if isinstance(element, LTTextContainer):
+                        text_chars += len(element.get_text().strip())
+            return "fast" if text_chars >= BORN_DIGITAL_MIN_CHARS else "hi_res"
+        except Exception as e:
+            print(f"Error inspecting PDF, falling back to hi_res: {str(e)}")
+            return "hi_res"
+
+    def process_pdf(self, pdf_path: str, strategy: str = "auto") -> List[Dict[str, Any]]:
         """Process PDF with improved organization and error handling"""
         pdf_name = os.path.basename(pdf_path)
         pdf_folder = os.path.join(
@@ -136,14 +388,21 @@ class MultimodalRag:
             pdf_dest = os.path.join(pdf_folder, pdf_name)
             shutil.copy2(pdf_path, pdf_dest)
 
-            print("Parsing PDF...")
+            strategy = self._choose_strategy(pdf_dest, strategy)
+            print(f"Parsing PDF with {strategy} strategy...")
+            partition_kwargs = {}
+            if strategy == "hi_res":
+                partition_kwargs = {
+                    "extract_images_in_pdf": True,
+                    "infer_table_structure": True,
+                }
             parsed_pdf = partition_pdf(
                 pdf_dest,
-                extract_images_in_pdf=True,
-                infer_table_structure=True,
+                strategy=strategy,
                 max_characters=4000,
                 new_after_n_chars=3800,
-                combine_text_under_n_chars=2000
+                combine_text_under_n_chars=2000,
+                **partition_kwargs
             )
 
             print("Processing images and creating summaries...")
@@ -176,17 +435,12 @@ class MultimodalRag:
     def remove_pdf_from_chromadb(self, pdf_name: str) -> None:
         """Remove all chunks related to a PDF from ChromaDB and clean up files"""
         try:
-            # Get the collection
-            collection = self.client.get_collection(name=self.collection_name)
+            # Remove from ChromaDB, the where filter is applied inside Chroma
+            # so no rows are fetched client-side
+            self._collection.delete(where={"pdf_name": pdf_name})
 
-            # Load metadata to get document IDs
             metadata = self._load_pdf_metadata(pdf_name)
             if metadata:
-                # Remove from ChromaDB
-                collection.delete(
-                    where={"pdf_name": pdf_name}
-                )
-
                 # Remove metadata file
                 metadata_path = os.path.join(
                     self.metadata_dir, f"{pdf_name}.json")
@@ -208,108 +462,183 @@ class MultimodalRag:
             print(f"Error removing PDF from ChromaDB: {str(e)}")
             raise
 
-    def ingest_pdf(self, pdf_path: str) -> None:
+    def ingest_pdf(self, pdf_path: str, strategy: str = "auto") -> None:
         """Ingest PDF with improved error handling and metadata tracking"""
         try:
-            chunks = self.process_pdf(pdf_path)
+            collection = self._collection
+            pdf_name = os.path.basename(pdf_path)
+            pdf_hash = self._hash_pdf(pdf_path)
+
+            # Skip PDFs whose current contents are fully in ChromaDB. The
+            # chunk count guards against an add that failed partway through,
+            # and lets PDFs that produced no chunks be skipped as well.
+            existing_ids = collection.get(
+                where={"pdf_name": pdf_name},
+                include=[]
+            )["ids"]
+            metadata = self._load_pdf_metadata(pdf_name)
+            if (metadata is not None
+                    and metadata.get("pdf_hash") == pdf_hash
+                    and metadata["chunk_count"] == len(existing_ids)):
+                print(f"{pdf_name} is already ingested, skipping")
+                return
+            if existing_ids:
+                # The PDF changed or was partially ingested, drop stale chunks
+                collection.delete(where={"pdf_name": pdf_name})
+
+            chunks = self.process_pdf(pdf_path, strategy=strategy)
             print("Creating embeddings...")
 
-            collection = self.client.get_or_create_collection(
-                name=self.collection_name
-            )
-
             # Create embeddings with PDF metadata
-            embeddings = [self.get_query_embedding(chunk) for chunk in chunks]
-            pdf_name = os.path.basename(pdf_path)
-
-            collection.add(
-                ids=[f"{pdf_name}_chunk_{i}" for i in range(len(chunks))],
-                documents=chunks,
-                embeddings=embeddings,
-                metadatas=[{
-                    "pdf_name": pdf_name,
-                    "page_number": index + 1,
-                    "chunk_number": index
-                } for index in range(len(chunks))]
-            )
+            embeddings = []
+            for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+                embeddings.extend(self._embed_documents(
+                    [chunk["text"] for chunk in chunks[start:start + EMBEDDING_BATCH_SIZE]],
+                    title=pdf_name))
+
+            ids = [f"{pdf_name}_chunk_{i}" for i in range(len(chunks))]
+            documents = [chunk["text"] for chunk in chunks]
+            metadatas = [{
+                "pdf_name": pdf_name,
+                "pdf_hash": pdf_hash,
+                "page_number": chunk["page_number"],
+                "chunk_number": index
+            } for index, chunk in enumerate(chunks)]
+
+            # Keep each add (one SQLite transaction) to a moderate size
+            for start in range(0, len(chunks), CHROMA_ADD_BATCH_SIZE):
+                end = start + CHROMA_ADD_BATCH_SIZE
+                collection.add(
+                    ids=ids[start:end],
+                    documents=documents[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end]
+                )
 
             print("PDF ingested successfully")
         except Exception as e:
             print(f"Error ingesting PDF: {str(e)}")
             raise
 
+    async def summarise_image_async(self, image_path: str, image_hash: str,
+                                    semaphore: asyncio.Semaphore) -> str:
+        """Summarise an image in a worker thread, bounded by the semaphore"""
+        async with semaphore:
+            return await asyncio.to_thread(self.summarise_image, image_path, image_hash)
+
+    async def _summarise_images(self, images: Dict[str, str]) -> List[Any]:
+        """Summarise images given as {hash: path} concurrently, preserving order"""
+        semaphore = asyncio.Semaphore(IMAGE_SUMMARY_CONCURRENCY)
+        progress = tqdm(total=len(images), desc="Processing images")
+
+        async def summarise(image_hash, image_path):
+            try:
+                return await self.summarise_image_async(image_path, image_hash, semaphore)
+            finally:
+                progress.update(1)
+
+        try:
+            return await asyncio.gather(
+                *[summarise(image_hash, image_path)
+                  for image_hash, image_path in images.items()],
+                return_exceptions=True
+            )
+        finally:
+            progress.close()
+
+    def normalize_image(self, image_path: str) -> Tuple[str, str]:
+        """Downscale an image to a compact JPEG, returning its path and content hash"""
+        jpeg_path = os.path.splitext(image_path)[0] + ".jpg"
+        try:
+            with Image.open(image_path) as img:
+                img = img.convert("RGB")
+                img.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE), Image.LANCZOS)
+                img.save(jpeg_path, "JPEG", optimize=True, quality=85)
+            if jpeg_path != image_path:
+                os.remove(image_path)
+        except Exception as e:
+            print(f"Error downscaling image {image_path}: {str(e)}")
+            jpeg_path = image_path
+
+        with open(jpeg_path, "rb") as f:
+            image_hash = hashlib.sha256(f.read()).hexdigest()
+        return jpeg_path, image_hash
+
     def replace_image_with_summary(self, parsed_pdf):
-        data_to_embed = []
-        images_found = 0
-        for parsed_object in tqdm(parsed_pdf, desc="Processing images"):
-            parsed_object = parsed_object.to_dict()
-            if parsed_object['type'] == "Image":
-                images_found += 1
-                print(
-                    f"Generating summary for image - {images_found}", end="\r", flush=True)
-                parsed_object['image_summary'] = self.summarise_image(
-                    parsed_object['metadata']['image_path'])
-            else:
-                print("Skipped not an image", end="\r", flush=True)
-            data_to_embed.append(parsed_object)
+        data_to_embed = [parsed_object.to_dict() for parsed_object in parsed_pdf]
+        images = [data for data in data_to_embed if data['type'] == "Image"]
+
+        # Figures repeated across the PDF are summarised only once
+        image_hashes = []
+        unique_images = {}
+        for data in images:
+            image_path, image_hash = self.normalize_image(
+                data['metadata']['image_path'])
+            data['metadata']['image_path'] = image_path
+            image_hashes.append(image_hash)
+            unique_images.setdefault(image_hash, image_path)
+        print(
+            f"Generating summaries for {len(unique_images)} unique images out of {len(images)}")
+
+        summaries = asyncio.run(self._summarise_images(unique_images))
+        summary_by_hash = {}
+        for image_hash, summary in zip(unique_images, summaries):
+            if isinstance(summary, Exception):
+                print(f"Error summarizing image: {str(summary)}")
+                summary = IMAGE_SUMMARY_ERROR_MESSAGE
+            summary_by_hash[image_hash] = summary
+
+        for data, image_hash in zip(images, image_hashes):
+            data['image_summary'] = summary_by_hash[image_hash]
 
         return data_to_embed
 
     def group_data_by_page(self, data_to_embed):
-        data_by_page = [[]]
-        cur_page_number = 1
+        data_by_page = []
+        cur_page_number = None
 
         for data in data_to_embed:
             if data['type'] == 'Footer':
                 continue
             if data['metadata']['page_number'] != cur_page_number:
-                cur_page_number += 1
+                cur_page_number = data['metadata']['page_number']
                 data_by_page.append([])
             data_by_page[-1].append(data)
 
         return data_by_page
 
-    def create_chunks(self, data_by_page):
-        chunks = []
-        for page in data_by_page:
-            chunk_text = []
-            for data in page:
-                if data['type'] == "Image":
-                    image_path = data['metadata']['image_path']
-                    relative_image_path = image_path.replace(os.getcwd(), ".")
-                    text = f"![{data['image_summary']}]({relative_image_path})"
-                else:
-                    text = data['text']
-                chunk_text.append(text)
-            chunks.append("\n".join(chunk_text))
-        return chunks
-
-    def get_query_embedding(self, query):
+    def create_chunks(self, data_by_page) -> List[Dict[str, Any]]:
+        """Pack each page's sentences into overlapping windows of CHUNK_SIZE words"""
+        # Chunking is cheap string work, so pages are chunked in-process. A
+        # process pool would cost more in worker start-up (each spawned worker
+        # re-imports unstructured, chromadb and genai) than it saves, and
+        # forking the multi-threaded Streamlit process risks deadlocks. The
+        # helpers are pure functions of the page elements, so they live at
+        # module scope and can be used without opening ChromaDB or Gemini.
+        return [chunk for page in data_by_page for chunk in _chunk_page(page)]
+
+    def _embed_documents(self, texts: List[str], title: str = None) -> List[List[float]]:
+        """Embed a batch of document chunks in a single API call"""
         result = genai.embed_content(
-            model="models/text-embedding-004", content=query)
+            model=EMBEDDING_MODEL,
+            content=texts,
+            task_type="retrieval_document",
+            title=title
+        )
         return result['embedding']
 
-    def remove_pdf_from_chromadb(self, pdf_name):
-        """Removes all chunks related to a PDF from ChromaDB."""
-        collection = self.client.get_collection(name=self.collection_name)
-        documents = collection.get()
-
-        # Identify document IDs related to the PDF
-        doc_ids_to_remove = [
-            doc_id for doc_id, metadata in zip(documents['ids'], documents['metadatas'])
-            if metadata.get("pdf_name") == pdf_name
-        ]
-
-        if doc_ids_to_remove:
-            collection.delete(ids=doc_ids_to_remove)
-            print(
-                f"Removed {len(doc_ids_to_remove)} chunks related to {pdf_name} from ChromaDB.")
-
-    def retrieve_similar_documents(self, query_text, top_k=3):
-        collection = self.client.get_collection(name=self.collection_name)
-        query_embedding = self.get_query_embedding(query_text)
-        results = collection.query(
-            query_embeddings=[query_embedding], n_results=top_k)
+    def _embed_query(self, text: str) -> List[float]:
+        """Embed a search query, asymmetric to the document embeddings"""
+        return list(_cached_query_embedding(text))
+
+    def retrieve_similar_documents(self, query_text, top_k=3, pdf_name=None):
+        query_embedding = self._embed_query(query_text)
+        results = self._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=top_k,
+            where={"pdf_name": pdf_name} if pdf_name else None,
+            include=["documents"]
+        )
         return [doc for doc in results['documents'][0]]
 
     def prompt_builder(self, context, question):
@@ -320,18 +649,34 @@ class MultimodalRag:
         Question: {question}
         """
 
-    def invoke(self, question, chat_history=[]):
+    def _stream_text(self, response):
+        """Yield response text chunks as Gemini produces them"""
+        try:
+            for chunk in response:
+                yield chunk.text
+        except Exception as e:
+            print(f"Error streaming response: {str(e)}")
+            yield f"\n\n{RESPONSE_ERROR_MESSAGE}"
+
+    def invoke(self, question, chat_history=[], pdf_name=None, stream=False):
 
         try:
-            context = self.retrieve_similar_documents(question)
+            context = self.retrieve_similar_documents(
+                question, pdf_name=pdf_name)
 
             chat_session = self.rag_model.start_chat(history=chat_history)
 
             prompt = self.prompt_builder(context, question)
+            if stream:
+                response = chat_session.send_message(prompt, stream=True)
+                return self._stream_text(response)
+
             response = chat_session.send_message(prompt)
 
             return response.text
 
         except Exception as e:
             print(f"Error generating response: {str(e)}")
-            return "I encountered an error while processing your question. Please try again or rephrase your question."
+            if stream:
+                return iter([RESPONSE_ERROR_MESSAGE])
+            return RESPONSE_ERROR_MESSAGE